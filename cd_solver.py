@@ -3,7 +3,6 @@
 """ Countdown numbers game solver  """
 
 import argparse
-import copy
 import curses
 import random
 import sys
@@ -12,9 +11,14 @@ import time
 BOTTOM_NUMS = list(range(1, 11)) * 2
 TOP_NUMS = [25, 50, 75, 100]
 LINECHARS = ["0", "0", "1", ".", " "]
+LINECHARS_POOL = LINECHARS * 100
 LINECOLRS = [23, 29, 35]
 BIGNUM = 1e32
 
+# color pair attributes indexed by color number, filled in once the color
+# pairs have been initialised
+COLOR_CACHE = []
+
 FONT = {
     "0": ["█████",
           "██ ██",
@@ -113,6 +117,10 @@ FONT = {
           "     "],
 }
 
+# glyph rows pre-padded with their leading space, so lines can be assembled
+# with a single join per row
+FONT_PADDED = {c: [" " + row for row in rows] for c, rows in FONT.items()}
+
 
 def apply_font(strings, width):
     """Represent a sequence of strings using font
@@ -126,10 +134,7 @@ def apply_font(strings, width):
     lines = []
     for s in strings:
         for row in range(5):
-            line = []
-            for c in s:
-                line.append(" " + FONT[c][row])
-            line = "".join(line)
+            line = "".join(FONT_PADDED[c][row] for c in s)
             if len(line) < width:
                 front_pad = (width - len(line)) // 2
                 back_pad = len(line) + front_pad - width
@@ -139,171 +144,171 @@ def apply_font(strings, width):
     return lines
 
 
-def is_factor(b, a):
-    """True if b is a factor of a"""
-    if b == 0:
-        return False
-    return (a / b) == (a // b)
-
-
-def choose_number(numbers):
-    """Randomly choose a number from a list and remove it from the list"""
-
-    if numbers:
-        num = random.choice(numbers)
-        numbers.remove(num)
-        return num
-
-    return None
-
+def remove_unused_steps(steps):
+    """Remove any step whose result is not used in subsequent steps
 
-def do_op(a, b, op):
-    """Perform an operator on two numbers"""
+    :param steps [str] : List of solution steps as 'a <op> b = result'
+    """
 
-    if op == "+":
-        return a + b
-    if op == "-":
-        return a - b
-    if op == "*":
-        return a * b
-    if op == "/":
-        return a // b
+    parsed = [step.split() for step in steps]
+    used_numbers = {p[0] for p in parsed} | {p[2] for p in parsed}
+    kept = [s for s, p in zip(steps[:-1], parsed) if p[4] in used_numbers]
+    steps[:] = kept + steps[-1:]
 
-    raise ValueError(f"Unexpected operator {op}")
 
+def format_steps(steps):
+    """Format solution steps as 'a <op> b = result' strings
 
-def remove_unused_steps(steps):
-    """Remove any step whose result is not used in subsequent steps
+    :param steps [tuple] : Sequence of steps as (num_a, op, num_b, res)
 
-    :param steps [str] : List of solution steps as 'a <op> b = result'
+    :returns [str] : List of solution steps as 'a <op> b = result'
     """
 
-    used_numbers = []
-    for step in steps:
-        num_a, _op, num_b, _eq, res = step.split()
-        used_numbers += [num_a, num_b]
-    steps_to_remove = []
-    for step in steps[:-1]:
-        num_a, _op, num_b, _eq, res = step.split()
-        if not res in used_numbers:
-            steps_to_remove.append(step)
-    for step in steps_to_remove:
-        steps.remove(step)
+    return [f"{a:>4d} {op} {b:<4d} = {res:<4d}" for a, op, b, res in steps]
+
 
+def guess(target, numbers):
+    """Find the best solution by dynamic programming over subsets
 
-def guess(target, numbers, steps=None, best=None):
-    """Guess a solution
+    Subsets of the available numbers are indexed by bitmask. For each subset
+    the reachable values are built bottom-up by combining the values of every
+    pair of complementary sub-subsets with each legal operator, so every
+    distinct value is computed once per subset.
 
     :param target number : the result we want to achieve
     :param numbers [number] : the numbers we can use in the solution
-    :param steps list : the steps we have taken so far to reach the
-        solution
-    :param best tuple : the best solution so far (x, y) where x is the
-        amount of error in the solution and y is the steps we took to get
-        there
 
     :returns tuple : the best solution (x, y) where x is the amount of
         error in the solution and y is the steps we took to get there
     """
 
-    numbers = copy.copy(numbers)
-
-    if not steps:
-        steps = []
-
     # if the target is in the list of numbers we have, then we already have the
     # solution
     if target in numbers:
         return 0, [f"{target} = {target}"]
 
-    if not best:
-        best = (BIGNUM, ["."])
-
-    # keep trying until we run out of numbers to use
-    while numbers:
-        num_a = choose_number(numbers)
-        num_b = choose_number(numbers)
-
-        if None in (num_a, num_b):
-            # we weren't able to get 2 numbers to use in this step, so give up
-            break
-
-        if num_b > num_a:
-            # num_a should be the higher number, in case we wish to do division
-            num_a, num_b = num_b, num_a
-
-        ops = ["+", "-"]
-
-        if 1 not in (num_a, num_b):
-            # it's only worth multiplying or dividing if both numbers are not 1
-            ops.append("*")
-            if is_factor(num_b, num_a):
-                # it's only worth dividing if num_b is a factor of num_a
-                ops.append("/")
-
-        op = random.choice(ops)
-
-        res = do_op(num_a, num_b, op)
+    # values[mask] maps each value reachable using exactly the numbers in
+    # mask to the steps taken to make it
+    n = len(numbers)
+    values = [{} for _ in range(1 << n)]
+    for i, num in enumerate(numbers):
+        values[1 << i][num] = ()
+
+    best = (BIGNUM, ())
+
+    for mask in range(1, 1 << n):
+        vals = values[mask]
+
+        # combine every pair of complementary sub-subsets, visiting each
+        # unordered split exactly once
+        sub = (mask - 1) & mask
+        while sub:
+            other = mask ^ sub
+            if sub > other:
+                for val_a, steps_a in values[sub].items():
+                    for val_b, steps_b in values[other].items():
+                        # num_a should be the higher number, in case we wish
+                        # to do division
+                        num_a, num_b = val_a, val_b
+                        if num_b > num_a:
+                            num_a, num_b = num_b, num_a
+
+                        results = [("+", num_a + num_b), ("-", num_a - num_b)]
+
+                        if 1 not in (num_a, num_b):
+                            # it's only worth multiplying or dividing if both
+                            # numbers are not 1
+                            results.append(("*", num_a * num_b))
+                            if num_b and num_a % num_b == 0:
+                                # it's only worth dividing if num_b is a
+                                # factor of num_a
+                                results.append(("/", num_a // num_b))
+
+                        for op, res in results:
+                            if res == 0 or res in vals:
+                                # a result of 0 will not be any use in getting
+                                # closer to the target, and a value we already
+                                # reached needs no second recipe
+                                continue
+
+                            steps = steps_a + steps_b + ((num_a, op, num_b, res),)
+                            vals[res] = steps
+
+                            error = abs(res - target)
+
+                            if error < best[0]:
+                                # record this as the best result so far
+                                best = (error, steps)
+
+                            if error == 0:
+                                # we have reached the target
+                                return 0, format_steps(steps)
+            sub = (sub - 1) & mask
+
+    if not best[1]:
+        return best[0], ["."]
+
+    return best[0], format_steps(best[1])
 
-        if res == 0:
-            # if performing the op gave a result of 0, that will not be any use
-            # in getting closer to the result, so put the numbers back and try
-            # again
-            numbers += [num_a, num_b]
-            continue
 
-        # record the op performed on this step
-        opstr = f"{num_a:>4d} {op} {num_b:<4d} = {res:<4d}"
+def randline(line, width, solution):
+    """Randomise a line to generate cool, matrix-y looking rubbish
 
-        steps.append(opstr)
+    :param line tuple : (line text as a list of chars, line colors)
+    :param width int : Screen width
+    :param solution [str] : The game solution thus far
 
-        error = abs(res - target)
+    :returns tuple : (line text as a list of chars, line colors)
+    """
 
-        if error < best[0]:
-            # record this as the best result so far
-            best = (error, steps)
+    # our pool of random characters will have some of the solution thus far
+    # sprinkled in for variation; only rebuild it when the solution changes
+    if len(solution) != randline.sol_len:
+        randline.pool = LINECHARS_POOL + [y for x in solution for y in x]
+        randline.sol_len = len(solution)
+    linechars = randline.pool
 
-        if error == 0:
-            # we have reached the target
-            break
+    if line is None:
+        # a whole line of random junk, drawn in bulk rather than one call to
+        # random per cell
+        line_txt = random.choices(linechars, k=width)
+        line_col = [COLOR_CACHE[c] for c in random.choices(LINECOLRS, k=width)]
+        return (line_txt, line_col)
 
-        # add the result to our group of numbers for potential re-use in
-        # subsequent steps
-        numbers.append(res)
+    # just modify a few random characters, in place
+    count = random.randint(1, 5)
+    chars = random.choices(linechars, k=count)
+    colrs = random.choices(LINECOLRS, k=count)
+    for char, colr in zip(chars, colrs):
+        num = random.randint(0, width - 1)
+        line[0][num] = char
+        line[1][num] = COLOR_CACHE[colr]
 
-        # perform another step
-        return guess(target, numbers, steps, best)
+    return line
 
-    return best
 
+randline.pool = LINECHARS_POOL
+randline.sol_len = -1
 
-def randline(line, width, solution):
-    """Randomise a line to generate cool, matrix-y looking rubbish
 
-    :param line tuple : (line text as a string, line color)
-    :param width int : Screen width
-    :param solution [str] : The game solution thus far
+def draw_line(stdscr, y, line):
+    """Draw a whole screen line, batching runs of equal color
 
-    :returns tuple : (line text as string, line color)
+    :param stdscr Window : The curses screen object
+    :param y int : The line number to draw at
+    :param line tuple : (line text as a list of chars, line colors)
     """
 
-    # our pool of random characters will have some of the solution thus far
-    # sprinkled in for variation
-    linechars = (LINECHARS * 100) + [y for x in solution for y in x]
-
-    if line is None:
-        # a whole line of random junk
-        line_txt = "".join([random.choice(linechars) for _ in range(width)])
-        line_col = [curses.color_pair(random.choice(LINECOLRS)) for _ in line_txt]
-    else:
-        # just modify 4 random characters in the line
-        for _ in range(random.randint(1, 5)):
-            num = random.randint(0, width - 1)
-            line_txt = line[0][:num] + random.choice(linechars) + line[0][num + 1 :]
-            rcol = curses.color_pair(random.choice(LINECOLRS))
-            line_col = line[1][:num] + [rcol] + line[1][num + 1 :]
-
-    return (line_txt, line_col)
+    line_txt, line_col = line
+    # write the text in one call, then color it per run of equal color
+    stdscr.addstr(y, 0, "".join(line_txt))
+    x = 0
+    while x < len(line_col):
+        run = x + 1
+        while run < len(line_col) and line_col[run] == line_col[x]:
+            run += 1
+        stdscr.chgat(y, x, run - x, line_col[x])
+        x = run
 
 
 def print_all_colors(stdscr):
@@ -331,10 +336,7 @@ def has_solution(targ, nums):
     :returns bool : True if a solution is possible
     """
 
-    error, solution = BIGNUM, None
-
-    for _ in range(1000):
-        error, solution = guess(targ, nums, best=(error, solution))
+    error, _solution = guess(targ, nums)
 
     return error == 0
 
@@ -350,20 +352,24 @@ def start_game(stdscr, width, height):
     target = [" ".join([str(x) for x in args.nums]), str(args.targ)]
     targ_lines = apply_font(target, width)
     height_mid = (height - (len(target) * 6)) // 2
+    color = COLOR_CACHE[LINECOLRS[-1]]
     for y, s in enumerate(targ_lines):
         ys = height_mid + y
-        for x in range(width):
-            if x > (len(s) - 1):
-                pass
-            elif s[x] == " ":
-                pass
-            else:
-                char = s[x]
-                color = curses.color_pair(LINECOLRS[-1])
-                try:
-                    stdscr.addstr(ys, x, char, color)
-                except Exception as exp:
-                    raise ValueError(f"{ys} {x} {char} {color}") from exp
+        limit = min(len(s), width)
+        x = 0
+        while x < limit:
+            if s[x] == " ":
+                x += 1
+                continue
+            # write each contiguous run of glyph characters in one go
+            run = x + 1
+            while run < limit and s[run] != " ":
+                run += 1
+            try:
+                stdscr.addstr(ys, x, s[x:run], color)
+            except Exception as exp:
+                raise ValueError(f"{ys} {x} {s[x:run]} {color}") from exp
+            x = run
 
     stdscr.getkey()
 
@@ -378,42 +384,33 @@ def find_solution(stdscr, width, height):
     :returns tuple : (solution, screen lines, current line number)
     """
 
-    lines = {}
-    num_attempts = 0
-    error, solution = BIGNUM, None
-
-    # try for a certain amount of time so that is looks like the computer is
-    # doing some actual work, even if it finds the answer very quickly
-    elapsed = 0
-    start = time.time()
-
-    while (error > 0) or elapsed < 4:
-        error, solution = guess(args.targ, args.nums, best=(error, solution))
+    lines = [None] * height
+    line_num = 0
 
-        num_attempts += 1
+    error, solution = guess(args.targ, args.nums)
 
-        # update the screen
-        if not num_attempts % 17:
-            line_num = num_attempts % height
-            lines[line_num] = randline(lines.get(line_num, None), width, solution)
+    # animate for a certain amount of time so that it looks like the computer
+    # is doing some actual work, even though the search has already finished
+    frame = 0
+    start = time.time()
 
-            for x in range(width):
-                char = lines[line_num][0][x]
-                color = lines[line_num][1][x]
-                stdscr.addstr(line_num, x, char, color)
+    while time.time() - start < 4:
+        line_num = frame % height
+        lines[line_num] = randline(lines[line_num], width, solution)
 
-            stdscr.refresh()
+        draw_line(stdscr, line_num, lines[line_num])
 
-        # stop if no solution found
-        if num_attempts > 5e5:
-            msg = "Couldn't find an exact solution."
-            width_mid = (width - len(msg)) // 2
-            stdscr.addstr(height // 2, width_mid, msg)
-            stdscr.refresh()
-            stdscr.getkey()
-            break
+        stdscr.refresh()
+        time.sleep(0.02)
+        frame += 1
 
-        elapsed = time.time() - start
+    # report if no exact solution was found
+    if error > 0:
+        msg = "Couldn't find an exact solution."
+        width_mid = (width - len(msg)) // 2
+        stdscr.addstr(height // 2, width_mid, msg)
+        stdscr.refresh()
+        stdscr.getkey()
 
     stdscr.refresh()
 
@@ -425,27 +422,21 @@ def print_end(stdscr, width, lines, line_num):
 
     :param stdscr Window : The curses screen object
     :param width int : Screen width
-    :param lines dict : Current screen lines
+    :param lines [tuple] : Current screen lines
     :param line_num int : Current line number
     """
 
     target = f"{args.nums} {[args.targ]}"
-    color = curses.color_pair(LINECOLRS[-1])
+    color = COLOR_CACHE[LINECOLRS[-1]]
     trgt_start = (width - len(target)) // 2
     trgt_end = trgt_start + len(target)
     stdscr.addstr(1, trgt_start, target, color)
-    for x in range(trgt_start, trgt_end):
-        color = curses.color_pair(LINECOLRS[-1])
-        char = target[x - trgt_start]
-        try:
-            line = list(lines[1][0])
-            line[x] = char
-            colors = list(lines[1][1])
-            colors[x] = color
-            lines[1] = ("".join(line), colors)
-            stdscr.addstr(line_num, x, char, color)
-        except Exception as exp:
-            raise ValueError(f"{lines[1][0][x]}") from exp
+    try:
+        lines[1][0][trgt_start:trgt_end] = list(target)
+        lines[1][1][trgt_start:trgt_end] = [color] * len(target)
+        stdscr.addstr(line_num, trgt_start, target, color)
+    except Exception as exp:
+        raise ValueError(f"{lines[1][0][trgt_start:trgt_end]}") from exp
 
 
 def run_game(stdscr):
@@ -472,19 +463,21 @@ def run_game(stdscr):
     sol_lines = apply_font(solution, width)
     height_mid = (height - (len(solution) * 6)) // 2
 
+    sol_color = COLOR_CACHE[LINECOLRS[-1]]
     for y, s in enumerate(sol_lines):
         ys = height_mid + y
+        # merge the solution glyphs over the background junk, then draw the
+        # whole line batched by color run
+        chars = []
+        colors = []
         for x in range(width):
-            if x > (len(s) - 1):
-                char = lines[ys][0][x]
-                color = lines[ys][1][x]
-            elif s[x] == " ":
-                char = lines[ys][0][x]
-                color = lines[ys][1][x]
+            if x > (len(s) - 1) or s[x] == " ":
+                chars.append(lines[ys][0][x])
+                colors.append(lines[ys][1][x])
             else:
-                char = s[x]
-                color = curses.color_pair(LINECOLRS[-1])
-            stdscr.addstr(ys, x, char, color)
+                chars.append(s[x])
+                colors.append(sol_color)
+        draw_line(stdscr, ys, (chars, colors))
 
     stdscr.refresh()
 
@@ -525,6 +518,7 @@ if __name__ == "__main__":
     curses.use_default_colors()
     for i in range(curses.COLORS):
         curses.init_pair(i, i, -1)
+    COLOR_CACHE[:] = [curses.color_pair(i) for i in range(curses.COLORS)]
     if not randomized:
         curses.wrapper(run_game)
     else: